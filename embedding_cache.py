@@ -0,0 +1,67 @@
+import hashlib
+import os
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+import numpy as np
+from diskcache import Cache
+
+CACHE_DIR = os.path.join(os.path.dirname(__file__), ".embedding_cache")
+MEMORY_SIZE = 4096
+
+# Disk keeps embeddings across restarts; the in-process LRU spares it the hot questions
+_disk = Cache(CACHE_DIR)
+_memory: "OrderedDict[str, np.ndarray]" = OrderedDict()
+
+
+def cache_key(text: str, model_name: str) -> str:
+    # The model name is part of the key so switching models never mixes vector spaces
+    return hashlib.sha256(f"{model_name}\n{text}".encode("utf-8")).hexdigest()
+
+
+def _remember(key: str, vector: np.ndarray) -> None:
+    _memory[key] = vector
+    _memory.move_to_end(key)
+    if len(_memory) > MEMORY_SIZE:
+        _memory.popitem(last=False)
+
+
+def get_cached(key: str) -> Optional[np.ndarray]:
+    vector = _memory.get(key)
+    if vector is not None:
+        _memory.move_to_end(key)
+        return vector
+    vector = _disk.get(key)
+    if vector is not None:
+        _remember(key, vector)
+    return vector
+
+
+# Splits distinct texts (keyed by cache key) into stored vectors and texts still to encode
+def find_uncached_texts(keyed_texts: Dict[str, str]) -> Tuple[Dict[str, np.ndarray], Dict[str, str]]:
+    cached, uncached = {}, {}
+    for key, text in keyed_texts.items():
+        vector = get_cached(key)
+        if vector is None:
+            uncached[key] = text
+        else:
+            cached[key] = vector
+    return cached, uncached
+
+
+# One embedding per text; encode only sees the cache misses
+def embed_texts(
+    texts: List[str],
+    model_name: str,
+    encode: Callable[[List[str]], np.ndarray],
+) -> np.ndarray:
+    keys = [cache_key(text, model_name) for text in texts]
+    vectors_by_key, uncached = find_uncached_texts(dict(zip(keys, texts)))
+    if uncached:
+        vectors = encode(list(uncached.values()))
+        for key, vector in zip(uncached.keys(), vectors):
+            # A row is a view; copy it so the LRU does not pin the whole batch
+            vector = vector.copy()
+            _disk.set(key, vector)
+            _remember(key, vector)
+            vectors_by_key[key] = vector
+    return np.stack([vectors_by_key[key] for key in keys])
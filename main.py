@@ -1,17 +1,31 @@
 from fastapi import FastAPI, UploadFile, File, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
-from sentence_transformers import SentenceTransformer, util
-from pdf2image import convert_from_bytes
-import pytesseract
+from sentence_transformers import SentenceTransformer
+from pdf2image import convert_from_path, pdfinfo_from_path
 import re
 from PIL import Image
 from typing import List, Dict, Any
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import connected_components
+import numpy as np
 import torch
 import asyncio
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from collections import deque
+import multiprocessing
+import threading
 import logging
+import hashlib
+import platform
+import tempfile
+from functools import lru_cache
 import os
+from diskcache import Cache
+from ocr_worker import init_worker, pack_page, ocr_one_page, Page, OCR_ENGINE_VARIANT
+from embedding_cache import embed_texts
+from question_scanner import build_keyword_table, scan_questions, ENDS_WITH_QUESTION_MARK, STARTS_WITH_KEYWORD
 
 # Router imports
 from youtube_summary import router as yt_router
@@ -23,9 +37,87 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Tesseract & Model
-pytesseract.pytesseract.tesseract_cmd = r"C:\Program Files\Tesseract-OCR\tesseract.exe"
-model = SentenceTransformer("all-MiniLM-L6-v2")
+MODEL_NAME = "all-MiniLM-L6-v2"
+
+def _cpu_has_avx512_vnni() -> bool:
+    # Only Linux exposes CPU flags without an extra dependency; elsewhere assume no VNNI
+    try:
+        with open("/proc/cpuinfo") as f:
+            return "avx512_vnni" in f.read().split()
+    except OSError:
+        return False
+
+def _onnx_int8_file() -> str:
+    # The model repo ships int8 exports per instruction set. Running the VNNI build
+    # on a CPU without VNNI can saturate the int8 GEMM and skew cosine scores, so the
+    # portable avx2 build is the default on x86.
+    if platform.machine().lower() in ("arm64", "aarch64"):
+        return "onnx/model_qint8_arm64.onnx"
+    if _cpu_has_avx512_vnni():
+        return "onnx/model_qint8_avx512_vnni.onnx"
+    return "onnx/model_quint8_avx2.onnx"
+
+ONNX_INT8_FILE = _onnx_int8_file()
+if torch.cuda.is_available():
+    EMBEDDING_VARIANT = f"{MODEL_NAME}:fp16"
+else:
+    EMBEDDING_VARIANT = f"{MODEL_NAME}:{os.path.basename(ONNX_INT8_FILE)}"
+
+# Loaded on first use and shared by every request in this process
+@lru_cache(maxsize=1)
+def get_model() -> SentenceTransformer:
+    if torch.cuda.is_available():
+        return SentenceTransformer(MODEL_NAME, device="cuda", model_kwargs={"torch_dtype": torch.float16})
+    return SentenceTransformer(MODEL_NAME, backend="onnx", model_kwargs={"file_name": ONNX_INT8_FILE})
+
 executor = ThreadPoolExecutor(max_workers=4)
+# Page OCR is CPU bound, so it runs as single-threaded Tesseract in one process per core.
+# Workers are spawned so they import only ocr_worker instead of inheriting this
+# process's torch / ONNX Runtime threads.
+_ocr_pool = None
+_ocr_pool_lock = threading.Lock()
+
+def get_ocr_pool() -> ProcessPoolExecutor:
+    global _ocr_pool
+    with _ocr_pool_lock:
+        if _ocr_pool is None:
+            _ocr_pool = ProcessPoolExecutor(
+                max_workers=os.cpu_count(),
+                initializer=init_worker,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return _ocr_pool
+
+def discard_ocr_pool(pool: ProcessPoolExecutor):
+    # A dead worker (Tesseract crash, OOM kill) breaks the pool for good; drop it
+    # so the next file gets a fresh one
+    global _ocr_pool
+    with _ocr_pool_lock:
+        if _ocr_pool is pool:
+            _ocr_pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+POPPLER_PATH = r"C:\Users\Pragati Kesharwani\Downloads\Release-24.08.0-0\poppler-24.08.0\Library\bin"
+# Pages are rendered a few at a time while earlier ones are OCR'd, so memory is
+# bounded by a fixed window of pages rather than by the length of the PDF or the
+# core count; poppler never gets more threads than there are pages in a chunk
+RENDER_CHUNK_PAGES = 4
+MAX_PAGES_IN_FLIGHT = 8
+RENDER_THREADS = min(RENDER_CHUNK_PAGES, os.cpu_count())
+# 200 DPI grayscale is enough for the LSTM engine and a third of the RGB bytes
+RENDER_DPI = 200
+
+# OCR text keyed by content hash, per whole PDF and per rendered page, so
+# re-uploaded papers (or ones with only a few edited pages) skip Tesseract
+OCR_CACHE_DIR = os.path.join(os.path.dirname(__file__), ".ocr_cache")
+OCR_CACHE_TTL = 7 * 24 * 60 * 60
+# Rendering and Tesseract settings are part of every key, so changing them never
+# serves text produced under the old ones
+OCR_VARIANT = f"{OCR_ENGINE_VARIANT}:dpi={RENDER_DPI}:gray"
+ocr_cache = Cache(OCR_CACHE_DIR)
+
+# Questions are kept as parallel lists, one per field, so grouping can index by position
+QUESTION_FIELDS = ("original", "normalized", "source_file", "question_id")
 
 # FastAPI app
 app = FastAPI(
@@ -56,7 +148,7 @@ def root():
 
 @app.get("/health")
 def health_check():
-    return {"status": "healthy", "model_loaded": model is not None}
+    return {"status": "healthy", "model_loaded": get_model.cache_info().currsize > 0}
 
 
 # ---------------------------- PDF FAQ Extraction ----------------------------
@@ -66,7 +158,7 @@ async def analyze_question_papers(files: List[UploadFile] = File(...)):
     if not files:
         raise HTTPException(status_code=400, detail="No files uploaded")
 
-    all_questions_data = []
+    all_questions_data = {field: [] for field in QUESTION_FIELDS}
     processing_results = []
 
     for file in files:
@@ -82,11 +174,12 @@ async def analyze_question_papers(files: List[UploadFile] = File(...)):
             pdf_bytes = await file.read()
             questions = await process_pdf(pdf_bytes, file.filename)
 
-            all_questions_data.extend(questions)
+            for field in QUESTION_FIELDS:
+                all_questions_data[field].extend(questions[field])
             processing_results.append({
                 "filename": file.filename,
                 "status": "success",
-                "questions_found": len(questions)
+                "questions_found": len(questions["original"])
             })
 
         except Exception as e:
@@ -97,7 +190,7 @@ async def analyze_question_papers(files: List[UploadFile] = File(...)):
                 "reason": str(e)
             })
 
-    if not all_questions_data:
+    if not all_questions_data["original"]:
         return JSONResponse(
             status_code=200,
             content={
@@ -111,7 +204,7 @@ async def analyze_question_papers(files: List[UploadFile] = File(...)):
 
     return {
         "message": f"Analyzed {len(files)} files",
-        "total_questions_found": len(all_questions_data),
+        "total_questions_found": len(all_questions_data["original"]),
         "processing_results": processing_results,
         "frequent_questions": frequent_questions,
         "summary": {
@@ -122,80 +215,148 @@ async def analyze_question_papers(files: List[UploadFile] = File(...)):
         }
     }
 
-async def process_pdf(pdf_bytes: bytes, filename: str) -> List[Dict[str, Any]]:
-    text = await asyncio.get_event_loop().run_in_executor(
-        executor, extract_text_with_ocr, pdf_bytes
-    )
-    logger.info(f"📝 OCR for {filename} done")
+async def process_pdf(pdf_bytes: bytes, filename: str) -> Dict[str, List[str]]:
+    pdf_key = f"pdf:{OCR_VARIANT}:" + hashlib.blake2b(pdf_bytes, digest_size=32).hexdigest()
+    text = ocr_cache.get(pdf_key)
+    if text is None:
+        text = await asyncio.get_event_loop().run_in_executor(
+            executor, extract_text_with_ocr, pdf_bytes
+        )
+        ocr_cache.set(pdf_key, text, expire=OCR_CACHE_TTL)
+        logger.info(f"📝 OCR for {filename} done")
+    else:
+        logger.info(f"⚡ Cached OCR for {filename}")
 
     raw_questions = extract_questions(text)
     logger.info(f"🔍 {len(raw_questions)} questions found in {filename}")
 
-    return [{
-        "original": q,
-        "normalized": normalize_question(q),
-        "source_file": filename,
-        "question_id": f"{filename}_{i+1}"
-    } for i, q in enumerate(raw_questions)]
+    return {
+        "original": raw_questions,
+        "normalized": [normalize_question(q) for q in raw_questions],
+        "source_file": [filename] * len(raw_questions),
+        "question_id": [f"{filename}_{i+1}" for i in range(len(raw_questions))]
+    }
 
 def extract_text_with_ocr(pdf_bytes: bytes) -> str:
-    images = convert_from_bytes(
-        pdf_bytes,
-        dpi=300,
-        poppler_path=r"C:\Users\Pragati Kesharwani\Downloads\Release-24.08.0-0\poppler-24.08.0\Library\bin"
-    )
-    text = ""
-    for img in images:
-        gray = img.convert("L")
-        text += pytesseract.image_to_string(gray, config='--psm 6') + "\n"
-    return text
-
-def extract_questions(text: str) -> List[str]:
-    lines = text.splitlines()
-    questions = []
+    # convert_from_bytes would write the PDF to a new temp file for every chunk, so
+    # write it once and render page ranges from that path. delete=False because
+    # Windows will not let poppler open a file that is still held open here.
+    with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as pdf_file:
+        pdf_file.write(pdf_bytes)
+    pool = get_ocr_pool()
+    try:
+        return _ocr_pdf_file(pdf_file.name, pool)
+    except BrokenProcessPool:
+        discard_ocr_pool(pool)
+        raise
+    finally:
+        os.remove(pdf_file.name)
+
+def _ocr_pdf_file(pdf_path: str, pool: ProcessPoolExecutor) -> str:
+    page_count = pdfinfo_from_path(pdf_path, poppler_path=POPPLER_PATH)["Pages"]
+    # Filled only from pages poppler actually rendered; a damaged page can yield
+    # fewer images than requested and is simply skipped, as before
+    page_texts = []
+    pending = deque()
+
+    def finish_oldest():
+        i, key, future = pending.popleft()
+        page_texts[i] = future.result()
+        ocr_cache.set(key, page_texts[i], expire=OCR_CACHE_TTL)
+
+    for first_page in range(1, page_count + 1, RENDER_CHUNK_PAGES):
+        images = convert_from_path(
+            pdf_path,
+            dpi=RENDER_DPI,
+            grayscale=True,
+            thread_count=RENDER_THREADS,
+            first_page=first_page,
+            last_page=min(first_page + RENDER_CHUNK_PAGES - 1, page_count),
+            poppler_path=POPPLER_PATH
+        )
+        for img in images:
+            page = pack_page(img)
+            key = page_cache_key(page)
+            page_text = ocr_cache.get(key)
+            page_texts.append(page_text)
+            if page_text is None:
+                while len(pending) >= MAX_PAGES_IN_FLIGHT:
+                    finish_oldest()
+                pending.append((len(page_texts) - 1, key, pool.submit(ocr_one_page, page)))
+
+    while pending:
+        finish_oldest()
+
+    return "".join(page_text + "\n" for page_text in page_texts)
+
+def page_cache_key(page: Page) -> str:
+    mode, size, data = page
+    digest = hashlib.blake2b(f"{mode}:{size[0]}x{size[1]}:".encode(), digest_size=32)
+    digest.update(data)
+    return f"page:{OCR_VARIANT}:" + digest.hexdigest()
+
+_LEADING_NUM = re.compile(r'^[\d\)\.\-\*\+\s]+')
+_WS = re.compile(r'\s+')
+_YEAR = re.compile(r'\b(19|20)\d{2}\b')
+_MARKS = re.compile(r'\b\d+\s*(marks?|points?)\b')
+_FILLER = re.compile(r'\b(briefly|short|detail|detailed|long|note on|account of|discussion on)\b')
+_DIAGRAM = re.compile(r'\b(with\s+)?(suitable\s+)?(neat\s+)?(diagram|figure|graph)\b')
+
+_QUESTION_STARTERS = (
+    'what', 'how', 'why', 'when', 'where', 'which', 'who', 'whose',
+    'define', 'explain', 'describe', 'state', 'write', 'discuss',
+    'derive', 'prove', 'calculate', 'find', 'determine', 'show',
+    'compare', 'differentiate', 'distinguish', 'analyze', 'evaluate',
+    'solve', 'compute', 'obtain', 'draw', 'sketch', 'plot',
+    'list', 'enumerate', 'mention', 'name', 'give', 'provide'
+)
 
-    question_starters = [
-        'what', 'how', 'why', 'when', 'where', 'which', 'who', 'whose',
-        'define', 'explain', 'describe', 'state', 'write', 'discuss',
-        'derive', 'prove', 'calculate', 'find', 'determine', 'show',
-        'compare', 'differentiate', 'distinguish', 'analyze', 'evaluate',
-        'solve', 'compute', 'obtain', 'draw', 'sketch', 'plot',
-        'list', 'enumerate', 'mention', 'name', 'give', 'provide'
-    ]
-
-    imperative_patterns = [
-        r'^(state|write|give|list|mention|name|draw|sketch)\b',
-        r'^write\s+(a\s+)?(short\s+|brief\s+)?note\s+on\b',
-        r'^give\s+(a\s+)?(brief\s+|short\s+)?account\s+of\b',
-        r'^derive\s+the\s+(formula|equation|expression)\b',
-        r'^prove\s+that\b',
-        r'^show\s+that\b',
-        r'^find\s+the\b',
-        r'^calculate\s+the\b',
-        r'^determine\s+the\b'
-    ]
-
-    for line in lines:
-        line = line.strip()
-        if not line or len(line) < 5 or len(line) > 300:
-            continue
-        clean_line = re.sub(r'^[\d\)\.\-\*\+\s]+', '', line).strip()
-        if not clean_line:
-            continue
+_IMPERATIVE_HEADS = ('state', 'write', 'give', 'list', 'mention', 'name', 'draw', 'sketch')
+
+# One anchored pattern instead of a first-word lookup plus a loop of searches.
+# A starter must be the whole first word; the imperative verbs only need a word
+# boundary, so "state:" or "name," still count. Longer imperative phrases such as
+# "prove that" or "write a short note on" already begin with a starter word.
+# Match it against str.lower() text rather than using re.IGNORECASE: Unicode case
+# folding would also accept look-alikes such as "ſtate".
+_QUESTION_RE = re.compile(
+    r'(?:' + '|'.join(_QUESTION_STARTERS) + r')(?:\s|$)'
+    r'|(?:' + '|'.join(_IMPERATIVE_HEADS) + r')\b'
+)
 
-        if line.endswith('?'):
-            questions.append(line)
-            continue
+# The same rules for the native scanner
+_STARTER_TABLE = build_keyword_table(_QUESTION_STARTERS)
+_HEAD_TABLE = build_keyword_table(_IMPERATIVE_HEADS)
+_MIN_QUESTION_LEN = 5
+_MAX_QUESTION_LEN = 300
+
+# Applied in order; each rewrites a family of openers to one canonical verb
+_QUESTION_MAPPINGS = tuple((re.compile(pattern), replacement) for pattern, replacement in (
+    (r'^(what is|define|what do you mean by|what are)\b', 'what is'),
+    (r'^(explain|describe|discuss|elaborate)\b', 'explain'),
+    (r'^(state|mention|write|give)\b', 'state'),
+    (r'^(how|in what way)\b', 'how'),
+    (r'^(why|what is the reason)\b', 'why'),
+    (r'^(derive|obtain|find the expression)\b', 'derive'),
+    (r'^(prove|show that|demonstrate)\b', 'prove'),
+    (r'^(calculate|compute|find|determine)\b', 'calculate')
+))
 
-        first_word = clean_line.split()[0].lower() if clean_line.split() else ""
-        if first_word in question_starters:
-            questions.append(line + ('?' if not line.endswith('?') else ''))
-            continue
+def extract_questions(text: str) -> List[str]:
+    # UTF-32 gives one array slot per character, so spans slice the str directly
+    codes = np.frombuffer(text.encode("utf-32-le", "surrogatepass"), dtype=np.uint32)
+    spans = scan_questions(codes, _MIN_QUESTION_LEN, _MAX_QUESTION_LEN, *_STARTER_TABLE, *_HEAD_TABLE)
 
-        for pattern in imperative_patterns:
-            if re.search(pattern, clean_line.lower()):
-                questions.append(line + ('?' if not line.endswith('?') else ''))
-                break
+    questions = []
+    for start, end, status in spans.tolist():
+        line = text[start:end]
+        if status == ENDS_WITH_QUESTION_MARK:
+            questions.append(line)
+        elif status == STARTS_WITH_KEYWORD:
+            questions.append(line + '?')
+        elif _QUESTION_RE.match(_LEADING_NUM.sub('', line).strip().lower()):
+            # Non-ASCII text decided the outcome, so the regexes get the final say
+            questions.append(line + '?')
 
     return questions
 
@@ -203,73 +364,92 @@ def normalize_question(question: str) -> str:
     q = question.lower().strip()
     if q.endswith('?'):
         q = q[:-1]
-    q = re.sub(r'^[\d\)\.\-\*\+\s]+', '', q)
-    q = re.sub(r'\s+', ' ', q)
-    q = re.sub(r'\b(19|20)\d{2}\b', '', q)
-    q = re.sub(r'\b\d+\s*(marks?|points?)\b', '', q)
-    q = re.sub(r'\b(briefly|short|detail|detailed|long)\b', '', q)
-    q = re.sub(r'\b(note on|account of|discussion on)\b', '', q)
-    q = re.sub(r'\b(with\s+)?(suitable\s+)?(neat\s+)?(diagram|figure|graph)\b', '', q)
-
-    question_mappings = {
-        r'^(what is|define|what do you mean by|what are)\b': 'what is',
-        r'^(explain|describe|discuss|elaborate)\b': 'explain',
-        r'^(state|mention|write|give)\b': 'state',
-        r'^(how|in what way)\b': 'how',
-        r'^(why|what is the reason)\b': 'why',
-        r'^(derive|obtain|find the expression)\b': 'derive',
-        r'^(prove|show that|demonstrate)\b': 'prove',
-        r'^(calculate|compute|find|determine)\b': 'calculate'
-    }
+    q = _LEADING_NUM.sub('', q)
+    q = _WS.sub(' ', q)
+    q = _YEAR.sub('', q)
+    q = _MARKS.sub('', q)
+    q = _FILLER.sub('', q)
+    q = _DIAGRAM.sub('', q)
 
-    for pattern, replacement in question_mappings.items():
-        q = re.sub(pattern, replacement, q)
+    for pattern, replacement in _QUESTION_MAPPINGS:
+        q = pattern.sub(replacement, q)
 
-    q = re.sub(r'\s+', ' ', q).strip()
+    q = _WS.sub(' ', q).strip()
     if not q.endswith('?'):
         q += '?'
 
     return q
 
-async def analyze_frequent_questions(questions_data: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-    if not questions_data:
+def encode_questions(texts: List[str]) -> np.ndarray:
+    embeddings = get_model().encode(texts, convert_to_numpy=True, normalize_embeddings=True, batch_size=128)
+    # fp16 GPU output is widened so the similarity matmul runs on float32 BLAS
+    return embeddings.astype(np.float32, copy=False)
+
+def build_similarity_graph(normalized_questions: List[str], embeddings: np.ndarray, threshold: float) -> csr_matrix:
+    # normalize_question rewrites openers to a canonical verb, so questions are only
+    # compared within the same first-word bucket. That makes the similarity matrix
+    # block diagonal: one small matmul per bucket instead of one N x N product.
+    buckets = {}
+    for i, question in enumerate(normalized_questions):
+        buckets.setdefault(question.split(' ', 1)[0], []).append(i)
+
+    rows = [np.empty(0, dtype=np.intp)]
+    cols = [np.empty(0, dtype=np.intp)]
+    for indices in buckets.values():
+        if len(indices) < 2:
+            continue
+        indices = np.array(indices)
+        block = embeddings[indices]
+        # Embeddings are unit length, so the matmul gives cosine similarity
+        r, c = np.nonzero(np.triu(np.matmul(block, block.T) >= threshold, k=1))
+        rows.append(indices[r])
+        cols.append(indices[c])
+
+    rows = np.concatenate(rows)
+    cols = np.concatenate(cols)
+    n = len(normalized_questions)
+    return csr_matrix((np.ones(len(rows), dtype=bool), (rows, cols)), shape=(n, n))
+
+async def analyze_frequent_questions(questions: Dict[str, List[str]]) -> List[Dict[str, Any]]:
+    normalized_questions = questions["normalized"]
+    if not normalized_questions:
         return []
 
-    normalized_questions = [q["normalized"] for q in questions_data]
-    embeddings = model.encode(normalized_questions, convert_to_tensor=True)
+    # normalize_question collapses many paraphrases to the same string, so only the
+    # distinct strings are embedded and compared; every copy inherits its group
+    unique_questions, inverse = np.unique(normalized_questions, return_inverse=True)
+    unique_questions = unique_questions.tolist()
+    embeddings = embed_texts(unique_questions, EMBEDDING_VARIANT, encode_questions)
 
-    groups = []
-    used_indices = set()
     similarity_threshold = 0.65
+    adjacency = build_similarity_graph(unique_questions, embeddings, similarity_threshold)
+    _, unique_labels = connected_components(adjacency, directed=False)
+    labels = unique_labels[inverse.ravel()]
+
+    originals = np.array(questions["original"], dtype=object)
+    source_files = np.array(questions["source_file"], dtype=object)
+    question_ids = np.array(questions["question_id"], dtype=object)
+
+    # A stable sort lays each component out contiguously in original order, so
+    # its first member is the earliest occurrence and becomes the main question
+    counts = np.bincount(labels)
+    order = np.argsort(labels, kind="stable")
+    starts = np.cumsum(counts) - counts
+    frequent_labels = np.flatnonzero(counts >= 2)
+    frequent_labels = frequent_labels[np.argsort(order[starts[frequent_labels]])]
 
-    for i, question_data in enumerate(questions_data):
-        if i in used_indices:
-            continue
-
-        group = {
-            "main_question": question_data["normalized"],
-            "variants": [question_data["original"]],
-            "source_files": [question_data["source_file"]],
-            "frequency": 1,
-            "question_ids": [question_data["question_id"]]
-        }
-        used_indices.add(i)
-
-        for j in range(i + 1, len(questions_data)):
-            if j in used_indices:
-                continue
-            similarity = util.cos_sim(embeddings[i], embeddings[j]).item()
-            if similarity >= similarity_threshold:
-                group["variants"].append(questions_data[j]["original"])
-                group["source_files"].append(questions_data[j]["source_file"])
-                group["question_ids"].append(questions_data[j]["question_id"])
-                group["frequency"] += 1
-                used_indices.add(j)
-
-        if group["frequency"] >= 2:
-            group["source_files"] = list(set(group["source_files"]))
-            group["unique_sources"] = len(group["source_files"])
-            groups.append(group)
+    groups = []
+    for label in frequent_labels:
+        members = order[starts[label]:starts[label] + counts[label]]
+        group_sources = list(set(source_files.take(members)))
+        groups.append({
+            "main_question": normalized_questions[members[0]],
+            "variants": originals.take(members).tolist(),
+            "source_files": group_sources,
+            "frequency": len(members),
+            "question_ids": question_ids.take(members).tolist(),
+            "unique_sources": len(group_sources)
+        })
 
     groups.sort(key=lambda x: x["frequency"], reverse=True)
     for i, group in enumerate(groups):
@@ -277,6 +457,3 @@ async def analyze_frequent_questions(questions_data: List[Dict[str, Any]]) -> Li
 
     logger.info(f"✅ Found {len(groups)} frequently asked question groups")
     return groups
-
-from materials import router as materials_router
-app.include_router(materials_router)
@@ -1,10 +1,12 @@
 from fastapi import APIRouter, UploadFile, File, HTTPException
 from fastapi.responses import FileResponse
 import os
+import aiofiles
 from typing import List
 
 router = APIRouter()
 BASE_DIR = os.path.join(os.path.dirname(__file__), "study_materials")
+UPLOAD_CHUNK_SIZE = 1 << 20  # 1 MiB
 
 
 @router.get("/materials/")
@@ -42,10 +44,12 @@ def list_materials(class_id: str, subject: str):
 
 
 @router.post("/materials/{class_id}/{subject}/upload")
-def upload_file(class_id: str, subject: str, file: UploadFile = File(...)):
+async def upload_file(class_id: str, subject: str, file: UploadFile = File(...)):
     upload_path = os.path.join(BASE_DIR, class_id, subject)
     os.makedirs(upload_path, exist_ok=True)
     filepath = os.path.join(upload_path, file.filename)
-    with open(filepath, "wb") as f:
-        f.write(file.file.read())
+    # Stream in chunks so a large upload never sits in memory or blocks the event loop
+    async with aiofiles.open(filepath, "wb") as f:
+        while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+            await f.write(chunk)
     return {"message": "Upload successful", "filename": file.filename}
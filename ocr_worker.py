@@ -0,0 +1,30 @@
+import os
+from typing import Tuple
+from PIL import Image
+
+TESSDATA_PATH = r"C:\Program Files\Tesseract-OCR\tessdata"
+OCR_LANG = "eng"
+OCR_PSM = "SINGLE_BLOCK"
+# Everything on the Tesseract side that changes the text; part of the OCR cache keys
+OCR_ENGINE_VARIANT = f"tesserocr:lang={OCR_LANG}:psm={OCR_PSM}"
+
+# A page travels to the worker as (mode, size, raw pixels), which pickles
+# far cheaper than a PIL image
+Page = Tuple[str, Tuple[int, int], bytes]
+
+_api = None
+
+def init_worker():
+    global _api
+    # One single-threaded Tesseract per process; OpenMP reads this when the library loads
+    os.environ["OMP_THREAD_LIMIT"] = "1"
+    from tesserocr import PyTessBaseAPI, PSM
+    _api = PyTessBaseAPI(path=TESSDATA_PATH, lang=OCR_LANG, psm=getattr(PSM, OCR_PSM))
+
+def pack_page(img: Image.Image) -> Page:
+    return img.mode, img.size, img.tobytes()
+
+def ocr_one_page(page: Page) -> str:
+    mode, size, data = page
+    _api.SetImage(Image.frombytes(mode, size, data))
+    return _api.GetUTF8Text()
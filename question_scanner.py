@@ -0,0 +1,128 @@
+from typing import Sequence, Tuple
+import numpy as np
+from numba import njit
+
+# Native line filter for extract_questions. The text is scanned as UTF-32 code
+# points, so every span indexes straight into the original Python string, and
+# whitespace / line breaks follow str.isspace() and str.splitlines() exactly.
+# Keywords are compared ASCII case-insensitively; whenever a non-ASCII character
+# could change the outcome the line is reported as UNDECIDED and the caller falls
+# back to the regexes.
+ENDS_WITH_QUESTION_MARK = 1
+STARTS_WITH_KEYWORD = 2
+UNDECIDED = 3
+
+KeywordTable = Tuple[np.ndarray, np.ndarray]
+
+
+def build_keyword_table(words: Sequence[str]) -> KeywordTable:
+    table = np.zeros((len(words), max(len(w) for w in words)), dtype=np.uint32)
+    for i, word in enumerate(words):
+        table[i, :len(word)] = [ord(ch) for ch in word.lower()]
+    return table, np.array([len(w) for w in words], dtype=np.int64)
+
+
+@njit(cache=True)
+def _is_space(c):
+    return (9 <= c <= 13 or 28 <= c <= 32 or c == 0x85 or c == 0xA0 or c == 0x1680
+            or 0x2000 <= c <= 0x200A or c == 0x2028 or c == 0x2029 or c == 0x202F
+            or c == 0x205F or c == 0x3000)
+
+
+@njit(cache=True)
+def _is_line_break(c):
+    return 10 <= c <= 13 or 28 <= c <= 30 or c == 0x85 or c == 0x2028 or c == 0x2029
+
+
+@njit(cache=True)
+def _is_leading_junk(c):
+    # [\d\)\.\-\*\+\s] for ASCII digits; other digits stop the scan as non-ASCII
+    return 48 <= c <= 57 or c == 41 or c == 42 or c == 43 or c == 45 or c == 46 or _is_space(c)
+
+
+@njit(cache=True)
+def _is_ascii_word(c):
+    return 48 <= c <= 57 or 65 <= c <= 90 or 97 <= c <= 122 or c == 95
+
+
+@njit(cache=True)
+def _match_keyword(codes, pos, end, table, lengths, k):
+    # 0 = no match, 1 = match, 2 = a non-ASCII character was hit before a mismatch
+    length = lengths[k]
+    for i in range(length):
+        if pos + i >= end:
+            return 0
+        c = codes[pos + i]
+        if c > 127:
+            return 2
+        if 65 <= c <= 90:
+            c += 32
+        if c != table[k, i]:
+            return 0
+    return 1
+
+
+@njit(cache=True)
+def scan_questions(codes, min_len, max_len, starters, starter_lengths, heads, head_lengths):
+    n = codes.shape[0]
+    # Every reported line holds at least min_len characters plus a line break
+    spans = np.empty((n // (min_len + 1) + 1, 3), dtype=np.int64)
+    found = 0
+    pos = 0
+    while pos < n:
+        stop = pos
+        while stop < n and not _is_line_break(codes[stop]):
+            stop += 1
+        next_pos = stop + 1
+        if stop + 1 < n and codes[stop] == 13 and codes[stop + 1] == 10:
+            next_pos = stop + 2
+
+        start, end = pos, stop
+        pos = next_pos
+        while start < end and _is_space(codes[start]):
+            start += 1
+        while end > start and _is_space(codes[end - 1]):
+            end -= 1
+        if end - start < min_len or end - start > max_len:
+            continue
+
+        clean = start
+        while clean < end and _is_leading_junk(codes[clean]):
+            clean += 1
+        if clean == end:
+            continue
+
+        status = 0
+        if codes[end - 1] == 63:
+            status = ENDS_WITH_QUESTION_MARK
+        elif codes[clean] > 127:
+            status = UNDECIDED
+        else:
+            # Starters must be the whole first word
+            for k in range(starters.shape[0]):
+                hit = _match_keyword(codes, clean, end, starters, starter_lengths, k)
+                if hit == 2:
+                    status = UNDECIDED
+                    break
+                after = clean + starter_lengths[k]
+                if hit == 1 and (after == end or _is_space(codes[after])):
+                    status = STARTS_WITH_KEYWORD
+                    break
+            # Imperative heads only need a word boundary
+            k = 0
+            while status == 0 and k < heads.shape[0]:
+                hit = _match_keyword(codes, clean, end, heads, head_lengths, k)
+                after = clean + head_lengths[k]
+                if hit == 2 or (hit == 1 and after < end and codes[after] > 127):
+                    status = UNDECIDED
+                elif hit == 1 and (after == end or not _is_ascii_word(codes[after])):
+                    status = STARTS_WITH_KEYWORD
+                k += 1
+
+        if status:
+            spans[found, 0] = start
+            spans[found, 1] = end
+            spans[found, 2] = status
+            found += 1
+
+    return spans[:found]
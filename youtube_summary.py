@@ -1,62 +1,181 @@
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 import yt_dlp
-import whisper
+from faster_whisper import WhisperModel
+import torch
 import os
 import uuid
 import subprocess
+import threading
+import asyncio
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+import numpy as np
+from diskcache import Cache
 
 router = APIRouter()
-model = whisper.load_model("base")  # or "small" / "medium"
+WHISPER_MODEL = "base"  # or "small" / "medium"
+# CTranslate2 int8 weights: int8 compute on CPU, int8 weights with fp16 activations on GPU
+WHISPER_DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
+WHISPER_COMPUTE_TYPE = "int8_float16" if WHISPER_DEVICE == "cuda" else "int8"
+# Greedy decoding; VAD skips silent stretches before they reach the decoder
+WHISPER_BEAM_SIZE = 1
+WHISPER_VAD_FILTER = True
+# Everything that changes the transcript; part of the cache key
+TRANSCRIPT_VARIANT = (
+    f"faster-whisper:{WHISPER_MODEL}:{WHISPER_COMPUTE_TYPE}"
+    f":beam={WHISPER_BEAM_SIZE}:vad={int(WHISPER_VAD_FILTER)}"
+)
+# The model is loaded on the first transcription and dropped after this long unused
+WHISPER_IDLE_TTL = 15 * 60
+
+_model = None
+_model_users = 0
+_model_lock = threading.Lock()
+_evict_timer = None
+
+def _load_model() -> WhisperModel:
+    return WhisperModel(WHISPER_MODEL, device=WHISPER_DEVICE, compute_type=WHISPER_COMPUTE_TYPE)
+
+def _evict_model():
+    global _model, _evict_timer
+    with _model_lock:
+        # A timer that fired just as it was being cancelled is no longer current
+        if _evict_timer is threading.current_thread() and _model_users == 0:
+            _model = None
+            _evict_timer = None
+            print("💤 Whisper model unloaded after idle timeout")
+
+@contextmanager
+def whisper_model():
+    global _model, _model_users, _evict_timer
+    with _model_lock:
+        if _evict_timer is not None:
+            _evict_timer.cancel()
+            _evict_timer = None
+        if _model is None:
+            _model = _load_model()
+        _model_users += 1
+        model = _model
+    try:
+        yield model
+    finally:
+        # The idle clock only starts once the last transcription finishes
+        with _model_lock:
+            _model_users -= 1
+            if _model_users == 0:
+                _evict_timer = threading.Timer(WHISPER_IDLE_TTL, _evict_model)
+                _evict_timer.daemon = True
+                _evict_timer.start()
+
+# Transcripts keyed by video id + TRANSCRIPT_VARIANT, so repeat requests skip Whisper entirely
+TRANSCRIPT_CACHE_DIR = os.path.join(os.path.dirname(__file__), ".transcript_cache")
+TRANSCRIPT_TTL = 30 * 24 * 60 * 60
+transcript_cache = Cache(TRANSCRIPT_CACHE_DIR)
+
+# Whisper's native input format
+SAMPLE_RATE = 16000
+
+# Downloads mostly wait on the network; transcription runs in its own process so it
+# never holds the server's GIL, with one worker because it owns the single model copy.
+# The worker is spawned, not forked: the parent may already have initialised CUDA,
+# and a forked child cannot initialise it again.
+yt_pool = ThreadPoolExecutor(max_workers=4)
+
+def _new_whisper_pool() -> ProcessPoolExecutor:
+    return ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn"))
+
+whisper_pool = _new_whisper_pool()
 
 class VideoURL(BaseModel):
     url: str
 
+def _ydl_opts(downloaded_file: str) -> dict:
+    return {
+        'format': 'bestaudio/best',
+        'outtmpl': downloaded_file,
+        'quiet': True,
+    }
+
+def _extract_info(url: str, downloaded_file: str) -> dict:
+    with yt_dlp.YoutubeDL(_ydl_opts(downloaded_file)) as ydl:
+        return ydl.extract_info(url, download=False)
+
+def _download_audio(info: dict, downloaded_file: str) -> bytes:
+    with yt_dlp.YoutubeDL(_ydl_opts(downloaded_file)) as ydl:
+        print("⬇️  Downloading...")
+        ydl.process_ie_result(info, download=True)
+    print("✅ Download completed")
+
+    # ✅ Decode straight to 16 kHz mono PCM on stdout, no intermediate file
+    convert_cmd = [
+        "ffmpeg",
+        "-i", downloaded_file,
+        "-vn",
+        "-f", "s16le",
+        "-acodec", "pcm_s16le",
+        "-ar", str(SAMPLE_RATE),
+        "-ac", "1",
+        "-"
+    ]
+    return subprocess.run(convert_cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL).stdout
+
+def _transcribe(raw_audio: bytes) -> str:
+    # Runs in whisper_pool; int16 PCM crosses the process boundary at half the size of float32
+    audio = np.frombuffer(raw_audio, np.int16).astype(np.float32) / 32768.0
+    print("🎧 Transcribing...")
+    with whisper_model() as model:
+        segments, _ = model.transcribe(audio, beam_size=WHISPER_BEAM_SIZE, vad_filter=WHISPER_VAD_FILTER)
+        transcript = " ".join(segment.text.strip() for segment in segments)
+    print("✅ Transcription done")
+    return transcript
+
+def _replace_whisper_pool(broken: ProcessPoolExecutor):
+    global whisper_pool
+    if whisper_pool is broken:
+        whisper_pool = _new_whisper_pool()
+    broken.shutdown(wait=False, cancel_futures=True)
+
 @router.post("/transcribe-youtube/")
-def transcribe_youtube_video(data: VideoURL):
+async def transcribe_youtube_video(data: VideoURL):
+    loop = asyncio.get_running_loop()
     base_name = f"temp-{uuid.uuid4().hex}"
     downloaded_file = f"{base_name}.webm"
-    audio_file = f"{base_name}.mp3"
 
     try:
         print("🎯 Received request for:", data.url)
 
-        ydl_opts = {
-            'format': 'bestaudio/best',
-            'outtmpl': downloaded_file,
-            'quiet': True,
-        }
+        # Resolve the canonical id first so different URLs for one video share a cache entry
+        info = await loop.run_in_executor(yt_pool, _extract_info, data.url, downloaded_file)
+        cache_key = f"{info['extractor_key']}:{info['id']}:{TRANSCRIPT_VARIANT}"
+        cached_transcript = transcript_cache.get(cache_key)
+        if cached_transcript is not None:
+            print("⚡ Cached transcript for", info['id'])
+            return {
+                "message": "Transcription successful",
+                "transcript": cached_transcript
+            }
+
+        raw_audio = await loop.run_in_executor(yt_pool, _download_audio, info, downloaded_file)
 
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            print("⬇️  Downloading...")
-            ydl.download([data.url])
-        print("✅ Download completed")
-
-        # ✅ Convert to mp3 using ffmpeg
-        convert_cmd = [
-            "ffmpeg",
-            "-y",  # overwrite if exists
-            "-i", downloaded_file,
-            "-vn",
-            "-acodec", "libmp3lame",
-            "-ar", "44100",
-            "-ac", "2",
-            "-b:a", "192k",
-            audio_file
-        ]
-        subprocess.run(convert_cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-
-        # 🔍 Check if audio file is valid
-        if not os.path.exists(audio_file) or os.path.getsize(audio_file) < 1024:
+        # 🔍 Check if audio is valid (two bytes per sample)
+        if len(raw_audio) // 2 < SAMPLE_RATE // 10:
             raise HTTPException(status_code=500, detail="Downloaded audio is too small or corrupt")
 
-        print("🎧 Transcribing...")
-        result = model.transcribe(audio_file)
-        print("✅ Transcription done")
+        pool = whisper_pool
+        try:
+            transcript = await loop.run_in_executor(pool, _transcribe, raw_audio)
+        except BrokenProcessPool:
+            # The worker died (OOM, CUDA fault); only this request fails, later ones get a new worker
+            _replace_whisper_pool(pool)
+            raise
+        transcript_cache.set(cache_key, transcript, expire=TRANSCRIPT_TTL)
 
         return {
             "message": "Transcription successful",
-            "transcript": result['text']
+            "transcript": transcript
         }
 
     except Exception as e:
@@ -65,6 +184,5 @@ def transcribe_youtube_video(data: VideoURL):
         raise HTTPException(status_code=500, detail=f"Transcription failed: {str(e)}")
 
     finally:
-        for f in [downloaded_file, audio_file]:
-            if os.path.exists(f):
-                os.remove(f)
+        if os.path.exists(downloaded_file):
+            os.remove(downloaded_file)